@@ -1,106 +1,166 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from xml.sax.saxutils import escape
+
 import cv2
-import xml.etree.ElementTree as ET
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Exports with fewer annotated frames than this are serialized in-process;
+# below it the process pool start-up costs more than it saves.
+PARALLEL_MIN_FRAMES = 20000
+PARALLEL_CHUNK_FRAMES = 500
+
+
+# Box colors per class; anything else is drawn in DEFAULT_COLOR
+CLASS_COLORS = {
+    'good-cup': (0, 255, 0),
+    'bad-cup': (255, 0, 0),
+    'no-cup': (255, 255, 0)
+}
+DEFAULT_COLOR = (0, 0, 255)
+
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_FONT_SCALE = 0.5
+LABEL_THICKNESS = 1
 
 
-def draw_annotations(image, annotations):
-    """Draw bounding boxes on an image"""
-    img_with_boxes = image.copy()
+@lru_cache(maxsize=256)
+def _text_size(label):
+    """Return ``(width, height)`` of ``label`` rendered in the label font."""
+    size, _ = cv2.getTextSize(label, LABEL_FONT, LABEL_FONT_SCALE,
+                              LABEL_THICKNESS)
+    return size
 
-    colors = {
-        'good-cup': (0, 255, 0),
-        'bad-cup': (255, 0, 0),
-        'no-cup': (255, 255, 0)
-    }
+
+def draw_annotations(image, annotations, inplace=False):
+    """Draw bounding boxes on an image
+
+    With ``inplace=True`` the boxes are drawn directly on ``image`` instead
+    of on a copy, for callers that own a scratch frame.
+    """
+    img_with_boxes = image if inplace else image.copy()
 
     for ann in annotations:
         x1, y1, x2, y2 = ann['bbox']
         class_name = ann['class']
-        color = colors.get(class_name, (0, 0, 255))
+        color = CLASS_COLORS.get(class_name, DEFAULT_COLOR)
 
         cv2.rectangle(img_with_boxes, (x1, y1), (x2, y2), color, 2)
 
         label = f"{class_name}"
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.5
-        thickness = 1
-        (text_width, text_height), _ = cv2.getTextSize(label, font, font_scale,
-                                                       thickness)
+        text_width, text_height = _text_size(label)
         cv2.rectangle(img_with_boxes,
                       (x1, y1 - text_height - 4),
                       (x1 + text_width + 4, y1),
                       color, -1)
-        cv2.putText(img_with_boxes, label, (x1 + 2, y1 - 2), font,
-                    font_scale, (255, 255, 255), thickness)
+        cv2.putText(img_with_boxes, label, (x1 + 2, y1 - 2), LABEL_FONT,
+                    LABEL_FONT_SCALE, (255, 255, 255), LABEL_THICKNESS)
 
     return img_with_boxes
 
 
-def generate_pascal_voc_xml(annotations_dict, video_name, video_shape):
-    """Return PASCAL VOC XML strings per frame."""
-    output = {}
-    h, w, c = video_shape
-
-    for frame_num, frame_annotations in annotations_dict.items():
-        if not frame_annotations:
-            continue
-
-        annotation = ET.Element("annotation")
-
-        folder = ET.SubElement(annotation, "folder")
-        folder.text = "frames"
-
-        filename = ET.SubElement(annotation, "filename")
-        filename.text = f"{video_name}_frame_{frame_num}.jpg"
-
-        source = ET.SubElement(annotation, "source")
-        database = ET.SubElement(source, "database")
-        database.text = "Custom Video Annotation"
-
-        size = ET.SubElement(annotation, "size")
-        width = ET.SubElement(size, "width")
-        width.text = str(w)
-        height = ET.SubElement(size, "height")
-        height.text = str(h)
-        depth = ET.SubElement(size, "depth")
-        depth.text = str(c)
+# The VOC layout is fixed and shallow, so documents are written straight
+# from these templates instead of building and serializing an element tree.
+_FRAME_TEMPLATE = (
+    '<?xml version="1.0" ?>\n'
+    '<annotation>\n'
+    '  <folder>frames</folder>\n'
+    '  <filename>{filename}</filename>\n'
+    '  <source>\n'
+    '    <database>Custom Video Annotation</database>\n'
+    '  </source>\n'
+    '  <size>\n'
+    '    <width>{width}</width>\n'
+    '    <height>{height}</height>\n'
+    '    <depth>{depth}</depth>\n'
+    '  </size>\n'
+    '  <segmented>0</segmented>\n'
+    '{objects}'
+    '</annotation>'
+)
+
+_OBJECT_TEMPLATE = (
+    '  <object>\n'
+    '    <name>{name}</name>\n'
+    '    <pose>Unspecified</pose>\n'
+    '    <truncated>0</truncated>\n'
+    '    <difficult>0</difficult>\n'
+    '    <bndbox>\n'
+    '      <xmin>{xmin}</xmin>\n'
+    '      <ymin>{ymin}</ymin>\n'
+    '      <xmax>{xmax}</xmax>\n'
+    '      <ymax>{ymax}</ymax>\n'
+    '    </bndbox>\n'
+    '  </object>\n'
+)
+
+
+def annotations_digest(annotations_dict):
+    """Return a hex digest that changes whenever ``annotations_dict`` does.
+
+    Cheap enough to compute on every export, so it can stand in for the
+    annotations themselves as a cache key.
+    """
+    if orjson is not None:
+        data = orjson.dumps(annotations_dict, option=orjson.OPT_NON_STR_KEYS
+                            | orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        data = json.dumps(annotations_dict, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
-        segmented = ET.SubElement(annotation, "segmented")
-        segmented.text = "0"
 
-        for ann in frame_annotations:
-            obj = ET.SubElement(annotation, "object")
+def generate_pascal_voc_xml(annotations_dict, video_name, video_shape):
+    """Return PASCAL VOC XML strings per frame."""
+    return dict(iter_pascal_voc_xml(annotations_dict, video_name, video_shape))
 
-            name = ET.SubElement(obj, "name")
-            name.text = ann['class']
 
-            pose = ET.SubElement(obj, "pose")
-            pose.text = "Unspecified"
+def iter_pascal_voc_xml(annotations_dict, video_name, video_shape):
+    """Yield ``(frame_num, xml)`` for every annotated frame.
 
-            truncated = ET.SubElement(obj, "truncated")
-            truncated.text = "0"
+    Lets callers write each document out as it is produced instead of
+    holding the whole export in memory. Large exports are sharded across a
+    process pool; frames are independent so the result is the same as the
+    sequential path.
+    """
+    items = [(frame_num, anns) for frame_num, anns in annotations_dict.items()
+             if anns]
+    if len(items) < PARALLEL_MIN_FRAMES:
+        yield from _iter_frames_xml(items, video_name, video_shape)
+        return
 
-            difficult = ET.SubElement(obj, "difficult")
-            difficult.text = "0"
+    chunks = [items[i:i + PARALLEL_CHUNK_FRAMES]
+              for i in range(0, len(items), PARALLEL_CHUNK_FRAMES)]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for partial in pool.map(_frames_to_xml, chunks,
+                                repeat(video_name), repeat(video_shape)):
+            yield from partial.items()
 
-            bndbox = ET.SubElement(obj, "bndbox")
-            xmin = ET.SubElement(bndbox, "xmin")
-            xmin.text = str(ann['bbox'][0])
-            ymin = ET.SubElement(bndbox, "ymin")
-            ymin.text = str(ann['bbox'][1])
-            xmax = ET.SubElement(bndbox, "xmax")
-            xmax.text = str(ann['bbox'][2])
-            ymax = ET.SubElement(bndbox, "ymax")
-            ymax.text = str(ann['bbox'][3])
 
-        from xml.dom import minidom
-        rough_string = ET.tostring(annotation, 'utf-8')
-        reparsed = minidom.parseString(rough_string)
-        pretty_xml = reparsed.toprettyxml(indent="  ")
+def _frames_to_xml(items, video_name, video_shape):
+    """Serialize ``(frame_num, annotations)`` pairs to ``{frame_num: xml}``."""
+    return dict(_iter_frames_xml(items, video_name, video_shape))
 
-        lines = pretty_xml.split('\n')
-        non_empty_lines = [line for line in lines if line.strip()]
-        pretty_xml = '\n'.join(non_empty_lines)
 
-        output[frame_num] = pretty_xml
+def _iter_frames_xml(items, video_name, video_shape):
+    """Lazy counterpart of :func:`_frames_to_xml`."""
+    h, w, c = video_shape
 
-    return output
+    for frame_num, frame_annotations in items:
+        objects = []
+        for ann in frame_annotations:
+            xmin, ymin, xmax, ymax = ann['bbox']
+            objects.append(_OBJECT_TEMPLATE.format(
+                name=escape(ann['class']),
+                xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax))
+
+        yield frame_num, _FRAME_TEMPLATE.format(
+            filename=escape(f"{video_name}_frame_{frame_num}.jpg"),
+            width=w, height=h, depth=c, objects=''.join(objects))
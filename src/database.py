@@ -1,108 +1,248 @@
+import atexit
+import logging
+import os
 import sqlite3
 import json
+import shutil
+import threading
+import time
+import zlib
 from pathlib import Path
 
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack is optional
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
 STORAGE_DIR = Path("annotation_storage")
 STORAGE_DIR.mkdir(exist_ok=True)
 
+DB_PATH = 'video_annotation.db'
+
+COPY_CHUNK_BYTES = 1024 * 1024  # 1 MB
+
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.m4v', '.3gp'})
+
+# Smallest serialized annotation payload worth compressing
+COMPRESS_MIN_BYTES = 128
+# First byte of a zlib stream and of a JSON list; MessagePack lists start
+# with 0x90-0x9f, 0xdc or 0xdd, so the three formats never collide
+_ZLIB_MAGIC = b'\x78'
+_JSON_MAGIC = b'['
+
+# Stored in PRAGMA user_version; bumped when existing rows need rewriting
+SCHEMA_VERSION = 1
+
+# Process-wide connection shared by all helpers, see _get_conn()
+_conn = None
+_conn_lock = threading.RLock()
+
+# Writes queued by queue_annotations(), keyed by (project, video, frame).
+# Lock order: _conn_lock before _pending_lock.
+WRITE_DELAY_SECONDS = 0.3
+# Longest a queued write waits while edits keep arriving, and the retry
+# interval after a failed flush
+MAX_WRITE_DELAY_SECONDS = 2.0
+_pending_writes = {}
+_pending_lock = threading.Lock()
+_pending_since = None  # time.monotonic() when the oldest queued write arrived
+_flush_timer = None
+
+
+def _get_conn():
+    """Return the process-wide SQLite connection, opening it on first use.
+
+    Streamlit runs every rerun on a fresh script thread, so a per-thread
+    connection would be reopened on each interaction; instead one connection
+    is shared and every helper holds ``_conn_lock`` while using it. The
+    connection is in autocommit mode with WAL journaling; multi-statement
+    writes issue an explicit ``BEGIN IMMEDIATE``/``COMMIT`` so they cost a
+    single sync.
+    """
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+            conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+            # Wait for writers in other processes instead of failing fast
+            conn.execute("PRAGMA busy_timeout=60000")
+            _conn = conn
+        return _conn
+
+
+def _encode_annotations(annotations):
+    """Serialize a frame's annotation list for the ``annotations_data`` column.
+
+    MessagePack is used when available, JSON otherwise. Payloads of at least
+    ``COMPRESS_MIN_BYTES`` are zlib-compressed; the repeated class/bbox keys
+    shrink several-fold even at level 1.
+    """
+    if msgpack is not None:
+        data = msgpack.packb(annotations, use_bin_type=True,
+                             default=_msgpack_default)
+    elif orjson is not None:
+        data = orjson.dumps(annotations, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        data = json.dumps(annotations).encode('utf-8')
+    if len(data) >= COMPRESS_MIN_BYTES:
+        data = zlib.compress(data, 1)
+    return data
+
+
+def _msgpack_default(obj):
+    # NumPy scalars and arrays (e.g. boxes computed with NumPy)
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _decode_annotations(data):
+    """Inverse of :func:`_encode_annotations`.
+
+    Also reads rows written by older versions: JSON text, and JSON bytes
+    with or without compression.
+    """
+    if isinstance(data, bytes):
+        if data[:1] == _ZLIB_MAGIC:
+            data = zlib.decompress(data)
+        if data[:1] != _JSON_MAGIC:
+            return msgpack.unpackb(data, raw=False)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _migrate_annotations(conn):
+    """Re-encode every stored annotation row in the current format."""
+    rows = conn.execute("SELECT id, annotations_data FROM annotations").fetchall()
+    conn.executemany("UPDATE annotations SET annotations_data = ? WHERE id = ?",
+                     [(_encode_annotations(_decode_annotations(data)), row_id)
+                      for row_id, data in rows])
+
 
 def init_database():
     """Initialize SQLite database for users and projects"""
-    conn = sqlite3.connect('video_annotation.db')
-    c = conn.cursor()
-
-    # Users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  email TEXT UNIQUE NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-
-    # Projects table
-    c.execute('''CREATE TABLE IF NOT EXISTS projects
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER NOT NULL,
-                  name TEXT NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users(id),
-                  UNIQUE(user_id, name))''')
-
-    # Annotations table
-    c.execute('''CREATE TABLE IF NOT EXISTS annotations
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  project_id INTEGER NOT NULL,
-                  video_name TEXT NOT NULL,
-                  frame_num INTEGER NOT NULL,
-                  annotations_data TEXT NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (project_id) REFERENCES projects(id))''')
-
-    conn.commit()
-    conn.close()
+    with _conn_lock:
+        c = _get_conn().cursor()
+
+        # Users table
+        c.execute('''CREATE TABLE IF NOT EXISTS users
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      email TEXT UNIQUE NOT NULL,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+        # Projects table
+        c.execute('''CREATE TABLE IF NOT EXISTS projects
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER NOT NULL,
+                      name TEXT NOT NULL,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (user_id) REFERENCES users(id),
+                      UNIQUE(user_id, name))''')
+
+        # Annotations table
+        c.execute('''CREATE TABLE IF NOT EXISTS annotations
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      project_id INTEGER NOT NULL,
+                      video_name TEXT NOT NULL,
+                      frame_num INTEGER NOT NULL,
+                      annotations_data BLOB NOT NULL,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (project_id) REFERENCES projects(id))''')
+
+        # Serves get_user_projects' filter and ORDER BY without a sort step
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_proj_user_updated
+                     ON projects(user_id, updated_at DESC)''')
+
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                # Older saves ran SELECT-then-INSERT without a transaction and
+                # could leave several rows for one frame; keep the newest,
+                # which is the one loading already returned
+                c.execute("""DELETE FROM annotations WHERE id NOT IN
+                             (SELECT MAX(id) FROM annotations
+                              GROUP BY project_id, video_name, frame_num)""")
+                # One row per frame; also the conflict target for batched upserts
+                c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_ann_pvf
+                             ON annotations(project_id, video_name, frame_num)''')
+                # One-time rewrite of rows stored as JSON before MessagePack
+                if msgpack is not None:
+                    _migrate_annotations(c)
+                    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+            c.execute("COMMIT")
+
+        # Refresh planner statistics where they are stale; cheap otherwise
+        c.execute("PRAGMA optimize")
 
 
 def get_or_create_user(email):
     """Get user ID or create new user"""
-    conn = sqlite3.connect('video_annotation.db')
-    c = conn.cursor()
+    with _conn_lock:
+        c = _get_conn().cursor()
 
-    c.execute("SELECT id FROM users WHERE email = ?", (email,))
-    result = c.fetchone()
+        c.execute("SELECT id FROM users WHERE email = ?", (email,))
+        result = c.fetchone()
 
-    if result:
-        user_id = result[0]
-    else:
-        c.execute("INSERT INTO users (email) VALUES (?)", (email,))
-        user_id = c.lastrowid
-        conn.commit()
+        if result:
+            return result[0]
 
-    conn.close()
-    return user_id
+        c.execute("INSERT INTO users (email) VALUES (?)", (email,))
+        return c.lastrowid
 
 
 def get_all_users():
     """Get all registered users"""
-    conn = sqlite3.connect('video_annotation.db')
-    c = conn.cursor()
-    c.execute("SELECT email FROM users ORDER BY email")
-    users = [row[0] for row in c.fetchall()]
-    conn.close()
-    return users
+    with _conn_lock:
+        c = _get_conn().cursor()
+        c.execute("SELECT email FROM users ORDER BY email")
+        return [row[0] for row in c.fetchall()]
 
 
 def create_project(user_id, project_name):
     """Create a new project for user"""
-    conn = sqlite3.connect('video_annotation.db')
-    c = conn.cursor()
-
-    try:
-        c.execute("INSERT INTO projects (user_id, name) VALUES (?, ?)",
-                  (user_id, project_name))
+    with _conn_lock:
+        c = _get_conn().cursor()
+        try:
+            c.execute("INSERT INTO projects (user_id, name) VALUES (?, ?)",
+                      (user_id, project_name))
+        except sqlite3.IntegrityError:
+            return None
         project_id = c.lastrowid
-        conn.commit()
 
-        # Create project directory
-        project_dir = STORAGE_DIR / f"user_{user_id}" / f"project_{project_id}"
-        project_dir.mkdir(parents=True, exist_ok=True)
+    # Create project directory
+    project_dir = STORAGE_DIR / f"user_{user_id}" / f"project_{project_id}"
+    project_dir.mkdir(parents=True, exist_ok=True)
 
-        return project_id
-    except sqlite3.IntegrityError:
-        return None
-    finally:
-        conn.close()
+    return project_id
 
 
 def get_user_projects(user_id):
     """Get all projects for a user"""
-    conn = sqlite3.connect('video_annotation.db')
-    c = conn.cursor()
-    c.execute("""SELECT id, name, created_at, updated_at
-                 FROM projects
-                 WHERE user_id = ?
-                 ORDER BY updated_at DESC""", (user_id,))
-    projects = c.fetchall()
-    conn.close()
-    return projects
+    with _conn_lock:
+        c = _get_conn().cursor()
+        c.execute("""SELECT id, name, created_at, updated_at
+                     FROM projects
+                     WHERE user_id = ?
+                     ORDER BY updated_at DESC""", (user_id,))
+        return c.fetchall()
 
 
 def save_video_to_project(user_id, project_id, video_file):
@@ -110,70 +250,166 @@ def save_video_to_project(user_id, project_id, video_file):
     project_dir = STORAGE_DIR / f"user_{user_id}" / f"project_{project_id}"
     video_path = project_dir / video_file.name
 
+    # Copy in fixed-size chunks so large uploads are never duplicated in RAM
+    video_file.seek(0)
     with open(video_path, "wb") as f:
-        f.write(video_file.getbuffer())
+        shutil.copyfileobj(video_file, f, length=COPY_CHUNK_BYTES)
 
     return str(video_path)
 
 
 def save_annotations(project_id, video_name, frame_num, annotations):
     """Save annotations to database"""
-    conn = sqlite3.connect('video_annotation.db')
-    c = conn.cursor()
-
-    # Check if annotation exists
-    c.execute("""SELECT id FROM annotations
-                 WHERE project_id = ? AND video_name = ? AND frame_num = ?""",
-              (project_id, video_name, frame_num))
-    result = c.fetchone()
-
-    annotations_json = json.dumps(annotations)
-
-    if result:
-        # Update existing
-        c.execute("""UPDATE annotations
-                     SET annotations_data = ?
-                     WHERE id = ?""",
-                  (annotations_json, result[0]))
-    else:
-        # Insert new
-        c.execute("""INSERT INTO annotations
-                     (project_id, video_name, frame_num, annotations_data)
-                     VALUES (?, ?, ?, ?)""",
-                  (project_id, video_name, frame_num, annotations_json))
-
-    # Update project timestamp
-    c.execute("UPDATE projects SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-              (project_id,))
-
-    conn.commit()
-    conn.close()
+    save_annotations_bulk(project_id, video_name, [(frame_num, annotations)])
+
+
+def save_annotations_bulk(project_id, video_name, items):
+    """Save annotations for many frames in a single transaction.
+
+    ``items`` is an iterable of ``(frame_num, annotations)`` pairs.
+    """
+    global _pending_since
+    rows = [(project_id, video_name, frame_num, _encode_annotations(annotations))
+            for frame_num, annotations in items]
+    if not rows:
+        return
+
+    with _conn_lock:
+        # Queued writes these rows supersede; a write queued while this one
+        # runs is newer and stays queued
+        with _pending_lock:
+            superseded = {row[:3]: _pending_writes.get(row[:3]) for row in rows}
+
+        conn = _get_conn()
+        # Take the write lock up front; a deferred BEGIN would have to upgrade
+        # from a read lock and can fail with SQLITE_BUSY without waiting
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("""INSERT INTO annotations
+                                (project_id, video_name, frame_num, annotations_data)
+                                VALUES (?, ?, ?, ?)
+                                ON CONFLICT(project_id, video_name, frame_num)
+                                DO UPDATE SET annotations_data = excluded.annotations_data""",
+                             rows)
+            conn.execute("UPDATE projects SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         (project_id,))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+        with _pending_lock:
+            for key, queued in superseded.items():
+                if queued is not None and _pending_writes.get(key) is queued:
+                    del _pending_writes[key]
+            if not _pending_writes:
+                _pending_since = None
+
+
+def queue_annotations(project_id, video_name, frame_num, annotations):
+    """Save annotations once edits have been idle for ``WRITE_DELAY_SECONDS``.
+
+    The canvas reports every intermediate state of a drag; only the latest
+    state queued for each frame is written, and all queued frames of a video
+    share one transaction. The queue is shared by all sessions, so however
+    busy it stays, nothing waits longer than ``MAX_WRITE_DELAY_SECONDS``.
+    """
+    global _pending_since
+    with _pending_lock:
+        now = time.monotonic()
+        if _pending_since is None:
+            _pending_since = now
+        _pending_writes[(project_id, video_name, frame_num)] = annotations
+        deadline = _pending_since + MAX_WRITE_DELAY_SECONDS
+        _schedule_flush(max(min(WRITE_DELAY_SECONDS, deadline - now), 0))
+
+
+def _schedule_flush(delay):
+    """(Re)start the flush timer; the caller holds ``_pending_lock``."""
+    global _flush_timer
+    if _flush_timer is not None:
+        _flush_timer.cancel()
+    _flush_timer = threading.Timer(delay, _flush_in_background)
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+
+def _flush_in_background():
+    try:
+        flush_annotations()
+    except Exception:
+        logger.exception("Saving queued annotations failed; will retry")
+
+
+def flush_annotations():
+    """Write all queued annotations now.
+
+    Frames leave the queue only once their transaction has committed. If a
+    write fails, its frames stay queued, a retry is scheduled and the error
+    is re-raised.
+    """
+    global _flush_timer
+    with _conn_lock:
+        with _pending_lock:
+            pending = dict(_pending_writes)
+            if _flush_timer is not None:
+                _flush_timer.cancel()
+                _flush_timer = None
+
+        by_video = {}
+        for (project_id, video_name, frame_num), annotations in pending.items():
+            by_video.setdefault((project_id, video_name), []).append(
+                (frame_num, annotations))
+        error = None
+        for (project_id, video_name), items in by_video.items():
+            try:
+                save_annotations_bulk(project_id, video_name, items)
+            except Exception as exc:
+                error = error or exc
+
+        if error is not None:
+            with _pending_lock:
+                _schedule_flush(MAX_WRITE_DELAY_SECONDS)
+            raise error
+
+
+atexit.register(flush_annotations)
 
 
 def load_project_annotations(project_id, video_name):
-    """Load all annotations for a video in a project"""
-    conn = sqlite3.connect('video_annotation.db')
-    c = conn.cursor()
-    c.execute("""SELECT frame_num, annotations_data
-                 FROM annotations
-                 WHERE project_id = ? AND video_name = ?""",
-              (project_id, video_name))
+    """Load all annotations for a video in a project
+
+    One query walks ``idx_ann_pvf``, so frames come back in order without a
+    sort step.
+    """
+    flush_annotations()
+    with _conn_lock:
+        c = _get_conn().cursor()
+        c.execute("""SELECT frame_num, annotations_data
+                     FROM annotations
+                     WHERE project_id = ? AND video_name = ?
+                     ORDER BY frame_num""",
+                  (project_id, video_name))
+        rows = c.fetchall()
 
     annotations = {}
-    for frame_num, data in c.fetchall():
-        annotations[frame_num] = json.loads(data)
+    for frame_num, data in rows:
+        annotations[frame_num] = _decode_annotations(data)
 
-    conn.close()
     return annotations
 
 
 def get_project_videos(user_id, project_id):
     """Get all videos in a project directory"""
     project_dir = STORAGE_DIR / f"user_{user_id}" / f"project_{project_id}"
-    if project_dir.exists():
-        return [
-            f
-            for f in project_dir.iterdir()
-            if f.suffix.lower() in ['.mp4', '.avi', '.mov', '.mkv', '.m4v', '.3gp']
-        ]
-    return []
+    try:
+        # scandir reports the entry type without a stat call per file
+        with os.scandir(project_dir) as entries:
+            return [
+                Path(entry.path)
+                for entry in entries
+                if entry.is_file()
+                and os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS
+            ]
+    except FileNotFoundError:
+        return []
@@ -1,23 +1,32 @@
 import re
 
+from bisect import bisect_left
 from pathlib import Path
+from typing import Iterable, List
 
 # File upload limits in bytes
 WARNING_SIZE_BYTES = 200 * 1024 * 1024  # 200 MB
 MAX_SIZE_BYTES = 500 * 1024 * 1024      # 500 MB
 
+# Sizes up to and including each threshold map to the label at its index
+_SIZE_THRESHOLDS = (WARNING_SIZE_BYTES, MAX_SIZE_BYTES)
+_SIZE_LABELS = ("ok", "warn", "reject")
+
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 
 def validate_email(email: str) -> bool:
     """Basic email validation."""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
+
+
+def validate_emails(emails: Iterable[str]) -> List[bool]:
+    """Validate many addresses, returning one flag per input."""
+    match = _EMAIL_RE.match
+    return [match(email) is not None for email in emails]
 
 
 def check_file_size(size_bytes: int) -> str:
     """Return ``'reject'`` if the file is too large,
     ``'warn'`` if it is large but acceptable, otherwise ``'ok'``."""
-    if size_bytes > MAX_SIZE_BYTES:
-        return "reject"
-    if size_bytes > WARNING_SIZE_BYTES:
-        return "warn"
-    return "ok"
+    return _SIZE_LABELS[bisect_left(_SIZE_THRESHOLDS, size_bytes)]
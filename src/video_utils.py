@@ -1,5 +1,49 @@
+import threading
+from itertools import chain
+from pathlib import Path
+
 import cv2
+import numpy as np
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Decoder used when get_frame() is not given one. OpenCV counts frames as
+# it reads them, so its numbering is the one stored annotations are keyed
+# by; the PyAV backend maps frame numbers to timestamps instead, which
+# only agrees on constant-frame-rate video (see _get_frame_pyav). PyAV is
+# not a requirement: install ``av`` to pass ``backend="pyav"``.
+DEFAULT_BACKEND = "opencv"
+
+# Largest forward jump (in frames) served by grabbing instead of seeking.
+# Seeking forces the decoder to resync from the previous keyframe; grab()
+# still decodes each skipped frame but carries on from the current one and
+# skips the retrieve()/colour conversion.
+MAX_GRAB_GAP = 30
+
+# Decoded frames kept by get_cached_frame, shared by the whole process.
+# An RGB frame is 6.2 MB at 1080p and 24.9 MB at 4K, so this holds about
+# 200 MB / 800 MB: the prefetch window (2 * PREFETCH_RADIUS + 1 frames)
+# plus recently viewed ones.
+FRAME_CACHE_ENTRIES = 32
+
+# Videos kept open by get_frame between calls
+CAPTURE_CACHE_ENTRIES = 8
+
+# Frames on each side of the current one decoded ahead of time
+PREFETCH_RADIUS = 8
+
+# Open options for the OpenCV backend: let FFmpeg use a hardware decoder
+# (VAAPI, D3D11, ...) where the host has one. OpenCV falls back to
+# software decoding when none is available, and _SharedCapture to the
+# default backend if FFmpeg cannot open the file at all.
+CAPTURE_PARAMS = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+# Latest prefetch request, the last one the worker took up, and the thread
+# serving them (None when idle), all guarded by the lock
+_prefetch_lock = threading.Lock()
+_prefetch_request = None
+_prefetch_last = None
+_prefetch_thread = None
 
 
 def load_video(video_path):
@@ -11,6 +55,8 @@ def load_video(video_path):
         return 0
 
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     cap.release()
 
     if total_frames <= 0:
@@ -20,18 +66,210 @@ def load_video(video_path):
     st.session_state.video_path = video_path
     st.session_state.total_frames = total_frames
     st.session_state.current_frame_num = 0
+    # Shape of the RGB frames get_frame() returns, known without decoding
+    st.session_state.frame_shape = (height, width, 3)
 
     return total_frames
 
 
-def get_frame(video_path, frame_number):
-    """Extract specific frame from video"""
-    cap = cv2.VideoCapture(video_path)
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-    ret, frame = cap.read()
-    cap.release()
+def _advance(cap, position, frame_number):
+    """Move ``cap`` from ``position`` to ``frame_number``.
+
+    Short forward jumps are served with ``grab()``, which decodes the skipped
+    frames from the current position instead of resyncing from the previous
+    keyframe, and never converts them. Anything else, or an unknown
+    ``position`` (``None``), falls back to a regular seek.
+    """
+    if position is not None and 0 <= frame_number - position <= MAX_GRAB_GAP:
+        gap = frame_number - position
+        for _ in range(gap):
+            if not cap.grab():
+                return False
+        return True
+    return cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+
+
+def get_frame(video_path, frame_number, backend=None):
+    """Extract specific frame from video
+
+    ``backend`` selects the decoder: ``"opencv"`` or ``"pyav"``, which seeks
+    to the preceding keyframe and decodes forward with FFmpeg. Defaults to
+    ``DEFAULT_BACKEND``. The PyAV backend is only suitable for
+    constant-frame-rate video without rotation metadata.
+    """
+    if (backend or DEFAULT_BACKEND) == "pyav":
+        return _get_frame_pyav(video_path, frame_number)
+
+    video_path = str(video_path)
+    try:
+        mtime = Path(video_path).stat().st_mtime
+        capture = _shared_capture(video_path, mtime)
+    except OSError:
+        return None
+    with capture.lock:
+        cap = capture.cap
+        ret = _advance(cap, capture.position, frame_number)
+        if ret:
+            ret, frame = cap.read()
+        capture.position = frame_number + 1 if ret else None
 
     if ret:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        return frame
+        # read() hands back a fresh buffer, so convert it in place rather
+        # than allocating a second full-size frame
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+    return None
+
+
+class _SharedCapture:
+    """An open ``VideoCapture`` plus the index of the frame it reads next."""
+
+    def __init__(self, video_path):
+        cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, CAPTURE_PARAMS)
+        if not cap.isOpened():
+            # Open it the way load_video() does
+            cap.release()
+            cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            # Raising keeps the failed capture out of the resource cache
+            raise OSError(f"Cannot open video: {video_path}")
+        self.cap = cap
+        self.position = 0
+        self.lock = threading.Lock()
+
+
+@st.cache_resource(max_entries=CAPTURE_CACHE_ENTRIES, show_spinner=False)
+def _shared_capture(video_path, mtime):
+    """Return the process-wide capture for ``video_path``.
+
+    Opening a capture parses the container and sets up the codec, so it is
+    done once per file rather than per frame; because the capture remembers
+    its position, stepping to the next frame needs no seek at all.
+    """
+    return _SharedCapture(video_path)
+
+
+def get_cached_frame(video_path, frame_number):
+    """Like :func:`get_frame`, but served from an LRU cache across reruns.
+
+    The file's modification time is part of the key so a replaced video is
+    decoded afresh.
+    """
+    mtime = Path(video_path).stat().st_mtime
+    return _cached_frame(str(video_path), frame_number, mtime)
+
+
+@st.cache_data(max_entries=FRAME_CACHE_ENTRIES, show_spinner=False)
+def _cached_frame(video_path, frame_number, mtime):
+    return get_frame(video_path, frame_number)
+
+
+def prefetch_frames(video_path, frame_number, total_frames,
+                    radius=PREFETCH_RADIUS):
+    """Warm the frame cache around ``frame_number`` in a background thread.
+
+    A single daemon thread serves requests; a newer request replaces one that
+    has not started yet, so fast scrubbing does not queue up stale work. A
+    request for the window the worker last took up is dropped: every full
+    rerun repeats it, and each cache hit would unpickle a frame for nothing.
+    """
+    global _prefetch_request, _prefetch_thread
+    mtime = Path(video_path).stat().st_mtime
+    request = (str(video_path), mtime, frame_number, total_frames, radius)
+    with _prefetch_lock:
+        if request == _prefetch_last:
+            _prefetch_request = None
+            return
+        _prefetch_request = request
+        if _prefetch_thread is not None:
+            return
+        _prefetch_thread = threading.Thread(target=_prefetch_worker, daemon=True)
+        add_script_run_ctx(_prefetch_thread, get_script_run_ctx())
+        _prefetch_thread.start()
+
+
+def _prefetch_worker():
+    global _prefetch_request, _prefetch_last, _prefetch_thread
+    while True:
+        with _prefetch_lock:
+            request, _prefetch_request = _prefetch_request, None
+            if request is None:
+                # Cleared under the lock so a request posted from now on
+                # starts a new thread
+                _prefetch_thread = None
+                return
+            _prefetch_last = request
+
+        video_path, mtime, center, total_frames, radius = request
+        # Frames ahead first: the shared decoder was just left past
+        # ``center``, so they decode without a seek. The frames behind follow
+        # in one ascending sweep, costing at most one seek rather than one
+        # per frame.
+        ahead = range(center + 1, min(center + radius + 1, total_frames))
+        behind = range(max(center - radius, 0), center)
+        for frame_number in chain(ahead, behind):
+            if _prefetch_request is not None:
+                break
+            _cached_frame(video_path, frame_number, mtime)
+
+
+class _SharedDecoder:
+    """An open PyAV container, its decode iterator and the next frame index."""
+
+    def __init__(self, video_path):
+        import av
+
+        self.container = av.open(video_path)
+        self.stream = self.container.streams.video[0]
+        self.frames = None
+        self.position = None
+        self.lock = threading.Lock()
+
+
+@st.cache_resource(max_entries=CAPTURE_CACHE_ENTRIES, show_spinner=False)
+def _shared_decoder(video_path, mtime):
+    return _SharedDecoder(video_path)
+
+
+def _get_frame_pyav(video_path, frame_number):
+    """Decode ``frame_number`` with PyAV, returning an RGB array or ``None``.
+
+    The container stays open between calls. Short forward steps continue
+    the running decode; anything else seeks to the preceding keyframe and
+    decodes forward from there.
+
+    Frame ``n`` is the one whose timestamp rounds to ``n`` at the stream's
+    average rate, so on variable-frame-rate video the numbering drifts from
+    OpenCV's frame count. Rotation metadata is not applied either, whereas
+    OpenCV auto-orients the frames and the shape ``load_video`` records.
+    """
+    try:
+        mtime = Path(video_path).stat().st_mtime
+    except OSError:
+        return None
+    decoder = _shared_decoder(str(video_path), mtime)
+    if decoder.stream.average_rate is None:
+        # No rate to map frame numbers onto timestamps with
+        return get_frame(video_path, frame_number, backend="opencv")
+
+    with decoder.lock:
+        stream = decoder.stream
+        start = stream.start_time or 0
+        frames_per_tick = stream.average_rate * stream.time_base
+
+        position = decoder.position
+        if position is None or not 0 <= frame_number - position <= MAX_GRAB_GAP:
+            target_pts = start + int(frame_number / frames_per_tick)
+            decoder.container.seek(target_pts, stream=stream)
+            decoder.frames = decoder.container.decode(stream)
+
+        decoder.position = None
+        for frame in decoder.frames:
+            if frame.pts is None:
+                continue
+            index = round((frame.pts - start) * frames_per_tick)
+            if index >= frame_number:
+                decoder.position = index + 1
+                # Rows can be padded to the decoder's line size; PIL needs
+                # a contiguous buffer to wrap without copying
+                return np.ascontiguousarray(frame.to_ndarray(format="rgb24"))
     return None
@@ -4,7 +4,14 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT))
 
-from src.annotation_utils import generate_pascal_voc_xml
+import numpy as np
+
+from src.annotation_utils import (
+    annotations_digest,
+    draw_annotations,
+    generate_pascal_voc_xml,
+    iter_pascal_voc_xml,
+)
 
 
 def test_generate_pascal_voc_xml_single():
@@ -16,3 +23,94 @@ def test_generate_pascal_voc_xml_single():
 
 def test_generate_pascal_voc_xml_empty():
     assert generate_pascal_voc_xml({}, "video", (10, 10, 3)) == {}
+
+
+EXPECTED_XML = """<?xml version="1.0" ?>
+<annotation>
+  <folder>frames</folder>
+  <filename>vid_frame_3.jpg</filename>
+  <source>
+    <database>Custom Video Annotation</database>
+  </source>
+  <size>
+    <width>20</width>
+    <height>10</height>
+    <depth>3</depth>
+  </size>
+  <segmented>0</segmented>
+  <object>
+    <name>a&amp;b</name>
+    <pose>Unspecified</pose>
+    <truncated>0</truncated>
+    <difficult>0</difficult>
+    <bndbox>
+      <xmin>1</xmin>
+      <ymin>2</ymin>
+      <xmax>3</xmax>
+      <ymax>4</ymax>
+    </bndbox>
+  </object>
+</annotation>"""
+
+
+def test_generate_pascal_voc_xml_layout():
+    anns = {3: [{"class": "a&b", "bbox": [1, 2, 3, 4]}]}
+    xml_map = generate_pascal_voc_xml(anns, "vid", (10, 20, 3))
+    assert xml_map[3] == EXPECTED_XML
+
+
+def test_draw_annotations_copies_by_default():
+    image = np.zeros((40, 60, 3), dtype=np.uint8)
+    out = draw_annotations(image, [{"class": "good-cup", "bbox": [5, 20, 30, 35]}])
+    assert out is not image
+    assert not image.any()
+    assert out.any()
+
+
+def test_draw_annotations_inplace():
+    image = np.zeros((40, 60, 3), dtype=np.uint8)
+    out = draw_annotations(image, [{"class": "good-cup", "bbox": [5, 20, 30, 35]}],
+                           inplace=True)
+    assert out is image
+    assert image.any()
+
+
+def test_generate_pascal_voc_xml_parallel_matches_sequential(monkeypatch):
+    from src import annotation_utils
+
+    anns = {i: [{"class": "bad-cup", "bbox": [i, i, i + 5, i + 5]}] if i % 3 else []
+            for i in range(10)}
+    expected = generate_pascal_voc_xml(anns, "video", (10, 10, 3))
+
+    monkeypatch.setattr(annotation_utils, "PARALLEL_MIN_FRAMES", 0)
+    monkeypatch.setattr(annotation_utils, "PARALLEL_CHUNK_FRAMES", 2)
+    assert generate_pascal_voc_xml(anns, "video", (10, 10, 3)) == expected
+    assert 0 not in expected
+
+
+def test_iter_pascal_voc_xml_is_lazy():
+    anns = {0: [{"class": "good-cup", "bbox": [1, 2, 3, 4]}], 1: [],
+            2: [{"class": "no-cup", "bbox": [2, 3, 4, 5]}]}
+    docs = iter_pascal_voc_xml(anns, "video", (10, 10, 3))
+
+    assert next(docs) == (0, generate_pascal_voc_xml(anns, "video", (10, 10, 3))[0])
+    assert [frame_num for frame_num, _ in docs] == [2]
+
+
+def test_generate_pascal_voc_xml_escapes_text():
+    import xml.etree.ElementTree as ET
+
+    anns = {1: [{"class": "<a & b>", "bbox": [1, 2, 3, 4]}]}
+    xml_map = generate_pascal_voc_xml(anns, "clip&co", (10, 20, 3))
+    root = ET.fromstring(xml_map[1])
+    assert root.findtext("filename") == "clip&co_frame_1.jpg"
+    assert root.findtext("object/name") == "<a & b>"
+
+
+def test_annotations_digest_tracks_content():
+    anns = {3: [{"class": "good-cup", "bbox": [1, 2, 3, 4]}], 1: []}
+    same = {1: [], 3: [{"bbox": [1, 2, 3, 4], "class": "good-cup"}]}
+    moved = {3: [{"class": "good-cup", "bbox": [1, 2, 3, 5]}], 1: []}
+
+    assert annotations_digest(anns) == annotations_digest(same)
+    assert annotations_digest(anns) != annotations_digest(moved)
@@ -0,0 +1,253 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import pytest
+
+from src import database as db
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(db, "STORAGE_DIR", Path(tmp_path))
+    monkeypatch.setattr(db, "_conn", None)
+    monkeypatch.setattr(db, "_pending_writes", {})
+    monkeypatch.setattr(db, "_pending_since", None)
+    db.init_database()
+    yield db
+    if db._conn is not None:
+        db._conn.close()
+
+
+def test_save_annotations_bulk_roundtrip(fresh_db):
+    user_id = fresh_db.get_or_create_user("user@example.com")
+    project_id = fresh_db.create_project(user_id, "proj")
+    anns = {
+        0: [{"class": "good-cup", "bbox": [1, 2, 3, 4]}],
+        5: [{"class": "bad-cup", "bbox": [5, 6, 7, 8]}],
+    }
+
+    fresh_db.save_annotations_bulk(project_id, "clip.mp4", anns.items())
+    assert fresh_db.load_project_annotations(project_id, "clip.mp4") == anns
+
+
+def test_save_annotations_bulk_upserts(fresh_db):
+    user_id = fresh_db.get_or_create_user("user@example.com")
+    project_id = fresh_db.create_project(user_id, "proj")
+    first = [{"class": "good-cup", "bbox": [1, 2, 3, 4]}]
+    second = [{"class": "no-cup", "bbox": [0, 0, 9, 9]}]
+
+    fresh_db.save_annotations_bulk(project_id, "clip.mp4", [(3, first)])
+    fresh_db.save_annotations_bulk(project_id, "clip.mp4", [(3, second)])
+    assert fresh_db.load_project_annotations(project_id, "clip.mp4") == {3: second}
+
+
+def test_save_annotations_overwrites_frame(fresh_db):
+    user_id = fresh_db.get_or_create_user("user@example.com")
+    project_id = fresh_db.create_project(user_id, "proj")
+    fresh_db.save_annotations(project_id, "clip.mp4", 2,
+                              [{"class": "good-cup", "bbox": [1, 2, 3, 4]}])
+    fresh_db.save_annotations(project_id, "clip.mp4", 2, [])
+    assert fresh_db.load_project_annotations(project_id, "clip.mp4") == {2: []}
+
+
+def test_save_video_to_project_streams_file(fresh_db, monkeypatch):
+    import io
+
+    monkeypatch.setattr(fresh_db, "COPY_CHUNK_BYTES", 7)
+    payload = bytes(range(256)) * 4
+    upload = io.BytesIO(payload)
+    upload.name = "clip.mp4"
+    upload.read(10)  # a previous reader left the cursor mid-file
+
+    (fresh_db.STORAGE_DIR / "user_1" / "project_1").mkdir(parents=True)
+    path = fresh_db.save_video_to_project(1, 1, upload)
+    assert Path(path).read_bytes() == payload
+
+
+def test_users_and_projects_share_connection(fresh_db):
+    user_id = fresh_db.get_or_create_user("user@example.com")
+    assert fresh_db.get_or_create_user("user@example.com") == user_id
+    assert fresh_db.get_all_users() == ["user@example.com"]
+
+    project_id = fresh_db.create_project(user_id, "proj")
+    assert fresh_db.create_project(user_id, "proj") is None
+    assert [p[:2] for p in fresh_db.get_user_projects(user_id)] == [(project_id, "proj")]
+
+
+def test_load_project_annotations_reads_legacy_json_text(fresh_db):
+    import json
+
+    anns = [{"class": "good-cup", "bbox": [1, 2, 3, 4]}]
+    fresh_db._get_conn().execute(
+        """INSERT INTO annotations (project_id, video_name, frame_num, annotations_data)
+           VALUES (?, ?, ?, ?)""", (1, "clip.mp4", 7, json.dumps(anns)))
+    assert fresh_db.load_project_annotations(1, "clip.mp4") == {7: anns}
+
+
+def test_init_database_migrates_json_rows(fresh_db):
+    import json
+    import zlib
+
+    anns = [{"class": "good-cup", "bbox": [i, i, i + 10, i + 10]} for i in range(20)]
+    conn = fresh_db._get_conn()
+    conn.executemany(
+        """INSERT INTO annotations (project_id, video_name, frame_num, annotations_data)
+           VALUES (1, 'clip.mp4', ?, ?)""",
+        [(0, json.dumps(anns[:1])), (1, zlib.compress(json.dumps(anns).encode(), 1))])
+    conn.execute("PRAGMA user_version = 0")
+
+    fresh_db.init_database()
+    stored = [data for data, in conn.execute(
+        "SELECT annotations_data FROM annotations ORDER BY frame_num")]
+    assert stored[0][:1] == b"\x91"  # one-element MessagePack array
+    assert fresh_db.zlib.decompress(stored[1])[:1] == b"\xdc"  # array16
+    assert fresh_db.load_project_annotations(1, "clip.mp4") == {0: anns[:1], 1: anns}
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == fresh_db.SCHEMA_VERSION
+
+
+def test_init_database_drops_duplicate_legacy_rows(tmp_path, monkeypatch):
+    import json
+    import sqlite3
+
+    # Schema and rows as written by the original, index-less save path
+    path = tmp_path / "legacy.db"
+    legacy = sqlite3.connect(path)
+    legacy.execute('''CREATE TABLE annotations
+                      (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       project_id INTEGER NOT NULL,
+                       video_name TEXT NOT NULL,
+                       frame_num INTEGER NOT NULL,
+                       annotations_data TEXT NOT NULL,
+                       created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    old = [{"class": "good-cup", "bbox": [1, 2, 3, 4]}]
+    new = [{"class": "bad-cup", "bbox": [5, 6, 7, 8]}]
+    legacy.executemany(
+        """INSERT INTO annotations (project_id, video_name, frame_num, annotations_data)
+           VALUES (1, 'clip.mp4', ?, ?)""",
+        [(3, json.dumps(old)), (4, json.dumps(old)), (3, json.dumps(new))])
+    legacy.commit()
+    legacy.close()
+
+    monkeypatch.setattr(db, "DB_PATH", str(path))
+    monkeypatch.setattr(db, "_conn", None)
+    monkeypatch.setattr(db, "_pending_writes", {})
+    try:
+        db.init_database()
+        assert db.load_project_annotations(1, "clip.mp4") == {3: new, 4: old}
+        db.save_annotations(1, "clip.mp4", 3, old)
+        assert db.load_project_annotations(1, "clip.mp4") == {3: old, 4: old}
+    finally:
+        db._conn.close()
+
+
+def test_large_frames_are_stored_compressed(fresh_db):
+    anns = [{"class": "good-cup", "bbox": [i, i, i + 10, i + 10]} for i in range(50)]
+    fresh_db.save_annotations(1, "clip.mp4", 0, anns)
+    fresh_db.save_annotations(1, "clip.mp4", 1, [])
+
+    stored = dict(fresh_db._get_conn().execute(
+        "SELECT frame_num, annotations_data FROM annotations"))
+    assert stored[0][:1] == fresh_db._ZLIB_MAGIC
+    assert stored[1] == b"\x90"  # empty MessagePack array
+    assert fresh_db.load_project_annotations(1, "clip.mp4") == {0: anns, 1: []}
+
+
+def test_connection_uses_wal(fresh_db):
+    conn = fresh_db._get_conn()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 60000
+
+
+def test_queued_writes_keep_latest_state(fresh_db, monkeypatch):
+    monkeypatch.setattr(fresh_db, "WRITE_DELAY_SECONDS", 60)
+    fresh_db.queue_annotations(1, "clip.mp4", 3, [{"class": "good-cup", "bbox": [1, 2, 3, 4]}])
+    latest = [{"class": "bad-cup", "bbox": [2, 3, 4, 5]}]
+    fresh_db.queue_annotations(1, "clip.mp4", 3, latest)
+
+    count = "SELECT COUNT(*) FROM annotations"
+    assert fresh_db._get_conn().execute(count).fetchone()[0] == 0
+    fresh_db.flush_annotations()
+    assert fresh_db.load_project_annotations(1, "clip.mp4") == {3: latest}
+
+
+def test_direct_save_supersedes_queued_write(fresh_db, monkeypatch):
+    monkeypatch.setattr(fresh_db, "WRITE_DELAY_SECONDS", 60)
+    fresh_db.queue_annotations(1, "clip.mp4", 3, [{"class": "good-cup", "bbox": [1, 2, 3, 4]}])
+    fresh_db.save_annotations(1, "clip.mp4", 3, [])
+
+    fresh_db.flush_annotations()
+    assert fresh_db.load_project_annotations(1, "clip.mp4") == {3: []}
+
+
+def test_queued_writes_flush_after_delay(fresh_db, monkeypatch):
+    import time
+
+    monkeypatch.setattr(fresh_db, "WRITE_DELAY_SECONDS", 0.05)
+    anns = [{"class": "no-cup", "bbox": [0, 0, 9, 9]}]
+    fresh_db.queue_annotations(1, "clip.mp4", 0, anns)
+
+    deadline = time.monotonic() + 5
+    while fresh_db._pending_writes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with fresh_db._conn_lock:
+        rows = fresh_db._get_conn().execute("SELECT frame_num FROM annotations").fetchall()
+    assert rows == [(0,)]
+
+
+def test_queued_writes_wait_at_most_max_delay(fresh_db, monkeypatch):
+    import time
+
+    monkeypatch.setattr(fresh_db, "WRITE_DELAY_SECONDS", 0.2)
+    monkeypatch.setattr(fresh_db, "MAX_WRITE_DELAY_SECONDS", 0.3)
+    count = "SELECT COUNT(*) FROM annotations"
+
+    # Keep editing faster than the idle delay for well past the cap
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        fresh_db.queue_annotations(1, "clip.mp4", 0, [])
+        with fresh_db._conn_lock:
+            if fresh_db._get_conn().execute(count).fetchone()[0]:
+                break
+        time.sleep(0.02)
+    else:
+        pytest.fail("queued write was postponed indefinitely")
+    fresh_db.flush_annotations()
+
+
+def test_failed_flush_keeps_writes_queued(fresh_db, monkeypatch):
+    import sqlite3
+
+    monkeypatch.setattr(fresh_db, "WRITE_DELAY_SECONDS", 60)
+    conn = fresh_db._get_conn()
+    conn.execute("""CREATE TEMP TRIGGER fail_insert BEFORE INSERT ON annotations
+                    BEGIN SELECT RAISE(ABORT, 'disk full'); END""")
+    anns = [{"class": "good-cup", "bbox": [1, 2, 3, 4]}]
+    fresh_db.queue_annotations(1, "clip.mp4", 3, anns)
+
+    with pytest.raises(sqlite3.DatabaseError):
+        fresh_db.flush_annotations()
+    assert fresh_db._pending_writes == {(1, "clip.mp4", 3): anns}
+
+    conn.execute("DROP TRIGGER fail_insert")
+    assert fresh_db.load_project_annotations(1, "clip.mp4") == {3: anns}
+    assert fresh_db._pending_writes == {}
+
+
+def test_load_project_annotations_orders_frames(fresh_db):
+    for frame_num in (9, 2, 5):
+        fresh_db.save_annotations(1, "clip.mp4", frame_num, [])
+    assert list(fresh_db.load_project_annotations(1, "clip.mp4")) == [2, 5, 9]
+
+
+def test_user_projects_use_index(fresh_db):
+    plan = fresh_db._get_conn().execute(
+        """EXPLAIN QUERY PLAN SELECT id, name, created_at, updated_at
+           FROM projects WHERE user_id = ? ORDER BY updated_at DESC""", (1,)).fetchall()
+    details = " ".join(row[-1] for row in plan)
+    assert "idx_proj_user_updated" in details
+    assert "TEMP B-TREE" not in details
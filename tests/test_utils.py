@@ -37,3 +37,21 @@ def test_get_project_videos_extensions(tmp_path, monkeypatch):
     assert ".m4v" in suffixes
     assert ".3gp" in suffixes
     assert ".txt" not in suffixes
+
+
+def test_get_project_videos_missing_dir_and_upper_case(tmp_path, monkeypatch):
+    from src import database as db
+
+    monkeypatch.setattr(db, "STORAGE_DIR", Path(tmp_path))
+    assert get_project_videos(1, 2) == []
+
+    proj_dir = db.STORAGE_DIR / "user_1" / "project_2"
+    (proj_dir / "nested.mp4").mkdir(parents=True)
+    (proj_dir / "CLIP.MP4").touch()
+    assert get_project_videos(1, 2) == [proj_dir / "CLIP.MP4"]
+
+
+def test_check_file_size_boundaries():
+    assert check_file_size(0) == "ok"
+    assert check_file_size(WARNING_SIZE_BYTES) == "ok"
+    assert check_file_size(MAX_SIZE_BYTES) == "warn"
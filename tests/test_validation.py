@@ -4,7 +4,7 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT))
 
-from src.utils import validate_email
+from src.utils import validate_email, validate_emails
 
 
 VALID_EMAILS = [
@@ -33,3 +33,8 @@ def test_validate_email_valid(email):
 @pytest.mark.parametrize("email", INVALID_EMAILS)
 def test_validate_email_invalid(email):
     assert not validate_email(email)
+
+
+def test_validate_emails_matches_single():
+    emails = VALID_EMAILS + INVALID_EMAILS
+    assert validate_emails(emails) == [validate_email(e) for e in emails]
@@ -0,0 +1,210 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import importlib.util
+
+import cv2
+import numpy as np
+import pytest
+
+from src.video_utils import MAX_GRAB_GAP, get_frame
+
+
+NUM_FRAMES = MAX_GRAB_GAP + 15
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    """Write a small MJPG clip whose frame ``i`` is filled with value ``4 * i``."""
+    path = tmp_path / "clip.avi"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"),
+                             10, (32, 24))
+    for i in range(NUM_FRAMES):
+        writer.write(np.full((24, 32, 3), 4 * i, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+BACKENDS = ["opencv", pytest.param("pyav", marks=pytest.mark.skipif(
+    importlib.util.find_spec("av") is None, reason="PyAV not installed"))]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("frame_num", [0, 1, MAX_GRAB_GAP, NUM_FRAMES - 1])
+def test_get_frame_returns_requested_frame(video_path, frame_num, backend):
+    frame = get_frame(video_path, frame_num, backend=backend)
+    assert frame.shape == (24, 32, 3)
+    assert abs(frame.mean() - 4 * frame_num) < 2
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_get_frame_reuses_decoder_in_any_order(video_path, backend):
+    for frame_num in [5, 6, 7, 2, NUM_FRAMES - 1, 0, MAX_GRAB_GAP + 3]:
+        frame = get_frame(video_path, frame_num, backend=backend)
+        assert abs(frame.mean() - 4 * frame_num) < 2
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_get_frame_missing_file(tmp_path, backend):
+    assert get_frame(str(tmp_path / "missing.avi"), 0, backend=backend) is None
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_get_frame_is_contiguous_rgb(video_path, backend):
+    frame = get_frame(video_path, 3, backend=backend)
+    assert frame.dtype == np.uint8 and frame.shape[2] == 3
+    assert frame.flags["C_CONTIGUOUS"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_get_frame_past_end(video_path, backend):
+    assert get_frame(video_path, NUM_FRAMES + 5, backend=backend) is None
+
+
+@pytest.fixture
+def vfr_video_path(tmp_path):
+    """Write an H.264 clip whose frames alternate 100 ms and 300 ms apart."""
+    av = pytest.importorskip("av")
+    if "libx264" not in av.codecs_available:
+        pytest.skip("PyAV built without libx264")
+    from fractions import Fraction
+
+    path = tmp_path / "vfr.mkv"
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("libx264", rate=10)
+        stream.width, stream.height = 32, 24
+        stream.pix_fmt = "yuv420p"
+        stream.time_base = Fraction(1, 1000)
+        stream.options = {"g": "10", "bf": "0"}
+        pts = 0
+        for i in range(NUM_FRAMES):
+            frame = av.VideoFrame.from_ndarray(
+                np.full((24, 32, 3), 4 * i, dtype=np.uint8), format="rgb24")
+            frame.pts = pts
+            pts += 100 if i % 2 == 0 else 300
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+    return str(path)
+
+
+def test_default_backend_counts_frames_of_variable_rate_clip(vfr_video_path):
+    for frame_num in range(NUM_FRAMES):
+        frame = get_frame(vfr_video_path, frame_num)
+        assert abs(frame.mean() - 4 * frame_num) < 3
+
+
+def test_pyav_without_average_rate_falls_back_to_opencv(video_path, monkeypatch):
+    from types import SimpleNamespace
+
+    from src import video_utils
+
+    decoder = SimpleNamespace(stream=SimpleNamespace(average_rate=None))
+    monkeypatch.setattr(video_utils, "_shared_decoder", lambda *args: decoder)
+    frame = get_frame(video_path, 3, backend="pyav")
+    assert abs(frame.mean() - 4 * 3) < 2
+
+
+def test_capture_falls_back_to_default_backend(video_path, monkeypatch):
+    from src import video_utils
+
+    opened = []
+    real_capture = cv2.VideoCapture
+
+    def capture(path, *args):
+        opened.append(args)
+        # The FFmpeg/hardware open fails; the plain one works
+        return real_capture(path + ".missing" if args else path)
+
+    monkeypatch.setattr(video_utils.cv2, "VideoCapture", capture)
+    frame = get_frame(video_path, 3, backend="opencv")
+    assert abs(frame.mean() - 4 * 3) < 2
+    assert opened == [(cv2.CAP_FFMPEG, video_utils.CAPTURE_PARAMS), ()]
+
+
+def test_unopenable_capture_is_not_cached(tmp_path, monkeypatch):
+    from src import video_utils
+
+    path = tmp_path / "broken.mp4"
+    path.write_bytes(b"not a video")
+    opened = []
+    real_capture = cv2.VideoCapture
+
+    def capture(*args):
+        opened.append(args)
+        return real_capture(*args)
+
+    monkeypatch.setattr(video_utils.cv2, "VideoCapture", capture)
+    assert get_frame(str(path), 0, backend="opencv") is None
+    assert get_frame(str(path), 0, backend="opencv") is None
+    assert len(opened) == 4  # both opens retried on the second call
+
+
+def test_get_cached_frame_matches_get_frame(video_path):
+    from src.video_utils import get_cached_frame
+
+    cached = get_cached_frame(video_path, 3)
+    assert np.array_equal(cached, get_frame(video_path, 3))
+    assert np.array_equal(get_cached_frame(video_path, 3), cached)
+
+
+def _wait_for_prefetch():
+    from src import video_utils
+
+    thread = video_utils._prefetch_thread
+    if thread is not None:
+        thread.join(timeout=10)
+
+
+def test_prefetch_frames_warms_cache(video_path, monkeypatch):
+    from src import video_utils
+
+    video_utils.prefetch_frames(video_path, 10, NUM_FRAMES, radius=2)
+    _wait_for_prefetch()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("frame was not prefetched")
+
+    monkeypatch.setattr(video_utils, "get_frame", fail)
+    for frame_num in (8, 9, 11, 12):
+        assert video_utils.get_cached_frame(video_path, frame_num) is not None
+
+
+def test_prefetch_frames_seeks_at_most_once(video_path, monkeypatch):
+    from src import video_utils
+
+    seeks = []
+    advance = video_utils._advance
+
+    def counting_advance(cap, position, frame_number):
+        if position is None or not 0 <= frame_number - position <= MAX_GRAB_GAP:
+            seeks.append(frame_number)
+        return advance(cap, position, frame_number)
+
+    monkeypatch.setattr(video_utils, "_advance", counting_advance)
+    video_utils.get_cached_frame(video_path, 20)
+    seeks.clear()
+    video_utils.prefetch_frames(video_path, 20, NUM_FRAMES, radius=4)
+    _wait_for_prefetch()
+    assert seeks == [16]
+
+
+def test_prefetch_frames_skips_repeated_request(video_path, monkeypatch):
+    from src import video_utils
+
+    video_utils.prefetch_frames(video_path, 10, NUM_FRAMES, radius=2)
+    _wait_for_prefetch()
+    assert video_utils._prefetch_thread is None
+
+    calls = []
+    monkeypatch.setattr(video_utils, "_cached_frame",
+                        lambda *args: calls.append(args))
+    video_utils.prefetch_frames(video_path, 10, NUM_FRAMES, radius=2)
+    _wait_for_prefetch()
+    assert calls == []
+
+    video_utils.prefetch_frames(video_path, 11, NUM_FRAMES, radius=2)
+    _wait_for_prefetch()
+    assert [args[1] for args in calls] == [12, 13, 9, 10]
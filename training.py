@@ -16,13 +16,16 @@ def collate_fn(batch):
 
 
 def _load_dataset(data_dir: str, annotation_format: str):
+    # Images are converted to tensors inside the DataLoader so they can be
+    # collated into pinned memory
+    to_tensor = transforms.ToTensor()
     if annotation_format.lower() == "coco":
         img_dir = os.path.join(data_dir, "images")
         ann_file = os.path.join(data_dir, "annotations.json")
-        return CocoDetection(img_dir, ann_file)
+        return CocoDetection(img_dir, ann_file, transform=to_tensor)
     else:
         # assume Pascal VOC style directory
-        return VOCDetection(data_dir)
+        return VOCDetection(data_dir, transform=to_tensor)
 
 
 def train_model(
@@ -58,10 +61,15 @@ def train_model(
     dataset = _load_dataset(data_dir, annotation_format)
     dataset_test = _load_dataset(data_dir, annotation_format)
 
-    data_loader = DataLoader(dataset, batch_size=2, shuffle=True, collate_fn=collate_fn)
-    data_loader_test = DataLoader(dataset_test, batch_size=2, shuffle=False, collate_fn=collate_fn)
-
     device = torch.device(device if device else ("cuda" if torch.cuda.is_available() else "cpu"))
+    # Page-locked batches let the host-to-device copies run asynchronously
+    pin_memory = device.type == "cuda"
+
+    data_loader = DataLoader(dataset, batch_size=2, shuffle=True, collate_fn=collate_fn,
+                             pin_memory=pin_memory)
+    data_loader_test = DataLoader(dataset_test, batch_size=2, shuffle=False, collate_fn=collate_fn,
+                                  pin_memory=pin_memory)
+
     model = fasterrcnn_resnet50_fpn(num_classes=num_classes)
     model.to(device)
 
@@ -73,7 +81,7 @@ def train_model(
     for epoch in range(num_epochs):
         model.train()
         for images, targets in data_loader:
-            images = list(transforms.ToTensor()(img).to(device) if not torch.is_tensor(img) else img.to(device) for img in images)
+            images = [img.to(device, non_blocking=pin_memory) for img in images]
             targets = [{k: torch.tensor(v).to(device) if isinstance(v, list) else v for k, v in t["annotation"].items()} for t in targets]
             loss_dict = model(images, targets)
             losses = sum(loss for loss in loss_dict.values())
@@ -86,7 +94,7 @@ def train_model(
         model.eval()
         with torch.no_grad():
             for images, targets in data_loader_test:
-                images = list(transforms.ToTensor()(img).to(device) if not torch.is_tensor(img) else img.to(device) for img in images)
+                images = [img.to(device, non_blocking=pin_memory) for img in images]
                 outputs = model(images)
                 formatted_targets = [{k: torch.tensor(v) if isinstance(v, list) else v for k, v in t["annotation"].items()} for t in targets]
                 metric.update(outputs, formatted_targets)
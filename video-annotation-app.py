@@ -1,10 +1,12 @@
+import numpy as np
 import streamlit as st
 from PIL import Image
 from pathlib import Path
+import inspect
 import io
 import zipfile
+from streamlit.errors import StreamlitAPIException
 from streamlit_drawable_canvas import st_canvas
-from training import train_model, upload_to_huggingface
 
 from src.database import (
     init_database,
@@ -14,11 +16,12 @@ from src.database import (
     get_user_projects,
     save_video_to_project,
     save_annotations,
+    queue_annotations,
     load_project_annotations,
     get_project_videos,
 )
-from src.video_utils import load_video, get_frame
-from src.annotation_utils import generate_pascal_voc_xml
+from src.video_utils import load_video, get_cached_frame, prefetch_frames
+from src.annotation_utils import annotations_digest, iter_pascal_voc_xml
 from src.utils import (
     validate_email,
     check_file_size,
@@ -26,13 +29,266 @@ from src.utils import (
     MAX_SIZE_BYTES,
 )
 
-# Initialize database on startup
-init_database()
+# Initialize database on startup; once per server process rather than on
+# every rerun
+@st.cache_resource(show_spinner=False)
+def ensure_database():
+    init_database()
 
 
-# Create directories for file storage
-STORAGE_DIR = Path("annotation_storage")
-STORAGE_DIR.mkdir(exist_ok=True)
+ensure_database()
+
+
+# st.fragment (1.37+) / st.experimental_fragment (1.33+); plain call before
+_fragment = (getattr(st, "fragment", None)
+             or getattr(st, "experimental_fragment", None)
+             or (lambda func: func))
+
+# Streamlit 1.37+ can rerun just the fragment that asked for it
+_FRAGMENT_RERUN = "scope" in inspect.signature(st.rerun).parameters
+
+
+def rerun_fragment():
+    """Rerun the enclosing fragment, or the whole app where unsupported."""
+    if _FRAGMENT_RERUN:
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            pass  # the fragment is running as part of a full app run
+    st.rerun()
+
+
+# Longest side of the background shown on the annotation canvas, in pixels
+CANVAS_MAX_SIDE = 1024
+
+
+# Sidebar lookups run on every rerun; cache them and clear after the
+# actions that change them
+LOOKUP_TTL_SECONDS = 30
+
+
+@st.cache_data(ttl=LOOKUP_TTL_SECONDS, show_spinner=False)
+def cached_users():
+    return get_all_users()
+
+
+@st.cache_data(ttl=LOOKUP_TTL_SECONDS, show_spinner=False)
+def cached_projects(user_id):
+    return get_user_projects(user_id)
+
+
+@st.cache_data(ttl=LOOKUP_TTL_SECONDS, show_spinner=False)
+def cached_videos(user_id, project_id):
+    return get_project_videos(user_id, project_id)
+
+
+# Repeated exports of unchanged annotations reuse the archive; the digest
+# stands in for the (unhashed) annotations as the cache key
+@st.cache_data(max_entries=4, show_spinner=False)
+def build_voc_zip(annotations_key, video_name, video_shape, _annotations):
+    zip_buffer = io.BytesIO()
+    exported = 0
+    # VOC XML is highly repetitive and deflates to roughly a tenth, which
+    # shrinks both the cached archive and the download; level 1 gets nearly
+    # all of that for a fraction of the default level's CPU
+    with zipfile.ZipFile(zip_buffer, 'w', compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=1) as zipf:
+        for frame_num, xml_str in iter_pascal_voc_xml(_annotations, video_name, video_shape):
+            zipf.writestr(f"{video_name}_frame_{frame_num}.xml", xml_str)
+            exported += 1
+    return zip_buffer.getvalue() if exported else None
+
+
+# Annotation statistics are kept up to date as annotations change instead
+# of being recounted on every rerun
+def set_annotations(annotations):
+    st.session_state.annotations = annotations
+    st.session_state.total_annotations = sum(len(anns) for anns in annotations.values())
+    st.session_state.annotated_frames = {f for f, anns in annotations.items() if anns}
+
+
+def set_frame_annotations(frame_num, annotations):
+    previous = st.session_state.annotations.get(frame_num, [])
+    st.session_state.annotations[frame_num] = annotations
+    st.session_state.total_annotations += len(annotations) - len(previous)
+    if annotations:
+        st.session_state.annotated_frames.add(frame_num)
+    else:
+        st.session_state.annotated_frames.discard(frame_num)
+
+
+# The canvas PNG-encodes its background on every rerun, so it is shown no
+# larger than the page can display; box coordinates map through ``scale``.
+# st.cache_resource hands back the same read-only image on each rerun
+# instead of converting (and resizing) the frame again.
+@st.cache_resource(max_entries=16, show_spinner=False)
+def canvas_background(video_path, frame_num, mtime):
+    frame = get_cached_frame(video_path, frame_num)
+    if frame is None:
+        return None, 1.0
+    pil_img = Image.fromarray(frame)
+    scale = min(1.0, CANVAS_MAX_SIDE / max(pil_img.size))
+    if scale < 1.0:
+        pil_img = pil_img.resize((round(pil_img.width * scale),
+                                  round(pil_img.height * scale)), Image.BILINEAR)
+    return pil_img, scale
+
+
+# Canvas, per-box class pickers and stats. Runs as a fragment where the
+# Streamlit version supports it, so drawing a box does not rerun the sidebar
+@_fragment
+def annotation_canvas(pil_img, scale, frame_num, video_name):
+    # --- Interactive bounding box annotation ---
+    st.subheader("Draw Bounding Boxes (Interactive)")
+    # Ensure canvas dimensions are integers
+    canvas_height = int(pil_img.height)
+    canvas_width = int(pil_img.width)
+    
+    # Get the saved annotations for this frame to setup initial_drawing
+    # This represents the state before the current interaction.
+    saved_annotations_for_this_frame = st.session_state.annotations.get(frame_num, [])
+
+    # Prepare initial_drawing for st_canvas from the saved annotations; reruns
+    # on an unchanged frame reuse the payload built last time
+    initial_key = (frame_num, tuple((ann['class'], *ann['bbox'])
+                                    for ann in saved_annotations_for_this_frame))
+    if st.session_state.get('initial_drawing_key') != (initial_key, scale):
+        initial_rects = [{
+            "type": "rect",
+            "left": x1 * scale, "top": y1 * scale,
+            "width": (x2 - x1) * scale, "height": (y2 - y1) * scale,
+            "stroke": "#000000",
+            "fill": "rgba(255, 165, 0, 0.3)",
+        } for x1, y1, x2, y2 in (ann['bbox'] for ann in saved_annotations_for_this_frame)]
+        st.session_state.initial_drawing_key = (initial_key, scale)
+        st.session_state.initial_drawing = (
+            {"version": "4.4.0", "objects": initial_rects} if initial_rects else None)
+    
+    # Generate a dynamic key for the canvas. This key changes if the number of 
+    # annotations for the frame changes, forcing a re-creation of the canvas component.
+    # This helps prevent state issues within the canvas component during rapid updates.
+    canvas_key = f"canvas_{frame_num}_{len(saved_annotations_for_this_frame)}"
+
+    # This list is a working copy for the current interaction cycle.
+    # It starts with the saved annotations and will be updated based on canvas output and selectboxes.
+    current_annotations_for_frame_being_edited = list(saved_annotations_for_this_frame)
+    
+    canvas_result = st_canvas(
+        fill_color="rgba(255, 165, 0, 0.3)",
+        stroke_width=2,
+        stroke_color="#000000",
+        background_image=pil_img,
+        drawing_mode="rect", # Only allows drawing new rectangles
+        update_streamlit=True, # Reruns on drawing
+        height=canvas_height,
+        width=canvas_width,
+        key=canvas_key, # Use the dynamic key
+        initial_drawing=st.session_state.initial_drawing
+    )
+    
+    # This list will hold the annotations derived from the current canvas state + selectbox choices
+    processed_annotations_from_this_interaction = [] 
+    
+    if canvas_result.json_data is not None and "objects" in canvas_result.json_data:
+        canvas_drawn_objects = canvas_result.json_data["objects"]
+        num_canvas_objects = len(canvas_drawn_objects)
+
+        # Adjust our working list of annotations to match the number of objects on canvas
+        # Add new placeholder annotations if new boxes were drawn
+        while len(current_annotations_for_frame_being_edited) < num_canvas_objects:
+            current_annotations_for_frame_being_edited.append({
+                'class': st.session_state.current_class, # Default for a brand new box
+                'bbox': [0,0,0,0] # Placeholder, will be updated from canvas obj
+            })
+
+        # Remove annotations if somehow canvas has fewer objects (e.g., undo if supported, or error)
+        # This is less likely in "rect" mode without explicit delete actions.
+        if num_canvas_objects < len(current_annotations_for_frame_being_edited):
+            current_annotations_for_frame_being_edited = current_annotations_for_frame_being_edited[:num_canvas_objects]
+
+        # Convert every object's left/top/width/height to [x1, y1, x2, y2] in
+        # one pass; truncating to int matches the per-box int() it replaces
+        rects = np.array([[o["left"], o["top"], o["width"], o["height"]]
+                          for o in canvas_drawn_objects], dtype=np.float64).reshape(-1, 4)
+        rects[:, 2:] += rects[:, :2]
+        if scale < 1.0:
+            # Back to frame pixels; rounding absorbs the float error of the
+            # round trip so untouched boxes keep their saved coordinates
+            rects = np.rint(rects / scale)
+        canvas_bboxes = rects.astype(np.int64).tolist()
+
+        class_index = {c: idx for idx, c in enumerate(st.session_state.classes)}
+        # The class pickers sit in a form, so relabelling boxes reruns the script
+        # once on submit instead of once per selectbox change
+        if canvas_drawn_objects:
+            with st.form(f"labels_{frame_num}"):
+                for i, obj_from_canvas in enumerate(canvas_drawn_objects):
+                    if obj_from_canvas["type"] == "rect":
+                        current_bbox_from_canvas = canvas_bboxes[i]
+
+                        # Get the class for this box. Default to its existing saved class.
+                        # current_annotations_for_frame_being_edited is now synced in length with canvas_drawn_objects
+                        class_for_selectbox_default = current_annotations_for_frame_being_edited[i]['class']
+                
+                        # Update bbox in our working list
+                        current_annotations_for_frame_being_edited[i]['bbox'] = current_bbox_from_canvas
+                
+                        # Selectbox for class
+                        label_key = f"label_{frame_num}_{i}"
+                        chosen_class_for_this_box = st.selectbox(
+                            f"Class for Box {i+1}",
+                            st.session_state.classes,
+                            index=class_index.get(class_for_selectbox_default, 0),
+                            key=label_key
+                        )
+                
+                        # Update class in our working list
+                        current_annotations_for_frame_being_edited[i]['class'] = chosen_class_for_this_box
+                st.form_submit_button("Apply labels")
+        
+        processed_annotations_from_this_interaction = current_annotations_for_frame_being_edited
+    
+    # Compare the fully processed annotations with the frame's content before this interaction.
+    # This determines if a save operation is truly needed. The working list shares its dicts
+    # with session_state, so comparing against session_state would miss edits to existing boxes.
+    processed_key = tuple((ann['class'], *ann['bbox'])
+                          for ann in processed_annotations_from_this_interaction)
+    if processed_key != initial_key[1]:
+        set_frame_annotations(frame_num, processed_annotations_from_this_interaction)
+        queue_annotations(
+            st.session_state.current_project_id,
+            video_name,
+            frame_num,
+            processed_annotations_from_this_interaction
+        )
+        # A rerun will happen naturally due to state change or widget interaction.
+        # No explicit st.rerun() here unless absolutely necessary.
+
+    # Clear all boxes button
+    if st.button("Clear All Boxes", key=f"clear_{frame_num}"):
+        set_frame_annotations(frame_num, [])
+        save_annotations(
+            st.session_state.current_project_id,
+            video_name,
+            frame_num,
+            []
+        )
+        # The stats below live in this fragment too, so nothing outside it
+        # needs to redraw
+        rerun_fragment()
+    
+    # Statistics
+    st.divider()
+    total_annotations = st.session_state.total_annotations
+    annotated_frames = len(st.session_state.annotated_frames)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Annotations", total_annotations)
+    with col2:
+        st.metric("Annotated Frames", annotated_frames)
+    with col3:
+        st.metric("Remaining Frames", st.session_state.total_frames - annotated_frames)
 
 
 # Initialize session state for user management
@@ -47,7 +303,7 @@ if 'current_project_name' not in st.session_state:
 
 # Original session state variables
 if 'annotations' not in st.session_state:
-    st.session_state.annotations = {}
+    set_annotations({})
 if 'classes' not in st.session_state:
     st.session_state.classes = ['good-cup', 'bad-cup', 'no-cup']
 if 'current_class' not in st.session_state:
@@ -58,6 +314,8 @@ if 'total_frames' not in st.session_state:
     st.session_state.total_frames = 0
 if 'current_frame_num' not in st.session_state:
     st.session_state.current_frame_num = 0
+if 'frame_shape' not in st.session_state:
+    st.session_state.frame_shape = None
 if 'training_metrics' not in st.session_state:
     st.session_state.training_metrics = []
 
@@ -74,7 +332,7 @@ if st.session_state.user_id is None:
         st.markdown("### Welcome! Please enter your workspace")
         
         # Check for existing users
-        existing_users = get_all_users()
+        existing_users = cached_users()
         
         if existing_users:
             workspace_option = st.radio(
@@ -98,6 +356,7 @@ if st.session_state.user_id is None:
                         if email not in existing_users:
                             st.session_state.user_id = get_or_create_user(email)
                             st.session_state.user_email = email
+                            cached_users.clear()
                             st.rerun()
                         else:
                             st.error("This email already has a workspace!")
@@ -109,6 +368,7 @@ if st.session_state.user_id is None:
                 if email and validate_email(email):
                     st.session_state.user_id = get_or_create_user(email)
                     st.session_state.user_email = email
+                    cached_users.clear()
                     st.rerun()
                 else:
                     st.error("Please enter a valid email address")
@@ -135,7 +395,7 @@ else:
         st.header("🗂️ Project Management")
         
         # Get user projects
-        projects = get_user_projects(st.session_state.user_id)
+        projects = cached_projects(st.session_state.user_id)
         
         # Project selection
         if projects:
@@ -147,17 +407,20 @@ else:
                 if st.button("Open Project"):
                     st.session_state.current_project_id = project_data[0]
                     st.session_state.current_project_name = project_data[1]
-                    st.session_state.annotations = {}
+                    set_annotations({})
                     st.session_state.video_path = None
                     st.rerun()
         
-        # Create new project
+        # Create new project; inside a form, typing does not rerun the script
         st.subheader("Create New Project")
-        new_project_name = st.text_input("Project Name")
-        if st.button("Create Project"):
+        with st.form("create_project", clear_on_submit=True):
+            new_project_name = st.text_input("Project Name")
+            create_submitted = st.form_submit_button("Create Project")
+        if create_submitted:
             if new_project_name:
                 project_id = create_project(st.session_state.user_id, new_project_name)
                 if project_id:
+                    cached_projects.clear()
                     st.session_state.current_project_id = project_id
                     st.session_state.current_project_name = new_project_name
                     st.success(f"Created project: {new_project_name}")
@@ -174,7 +437,8 @@ else:
             # Upload new video
             video_file = st.file_uploader(
                 "Upload new video",
-                type=['mp4', 'avi', 'mov', 'mkv', 'm4v', '3gp']
+                type=['mp4', 'avi', 'mov', 'mkv', 'm4v', '3gp'],
+                accept_multiple_files=False
             )
             if video_file is not None:
                 size_status = check_file_size(video_file.size)
@@ -189,28 +453,29 @@ else:
                             st.session_state.current_project_id,
                             video_file
                         )
+                        cached_videos.clear()
                         st.success(f"Added {video_file.name} to project")
                         st.rerun()
             
             # List project videos
             st.subheader("Project Videos")
-            videos = get_project_videos(st.session_state.user_id, st.session_state.current_project_id)
+            videos = cached_videos(st.session_state.user_id, st.session_state.current_project_id)
             
             if videos:
-                for video_path in videos:
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        st.text(video_path.name)
-                    with col2:
-                        if st.button("Load", key=f"load_{video_path.name}"):
-                            if load_video(str(video_path)) > 0:
-                                st.session_state.annotations = load_project_annotations(
-                                    st.session_state.current_project_id,
-                                    video_path.name
-                                )
-                                st.rerun()
-                            else:
-                                st.error("Unable to load video")
+                video_path = st.selectbox(
+                    "Select video",
+                    videos,
+                    format_func=lambda path: path.name
+                )
+                if st.button("Load Video"):
+                    if load_video(str(video_path)) > 0:
+                        set_annotations(load_project_annotations(
+                            st.session_state.current_project_id,
+                            video_path.name
+                        ))
+                        st.rerun()
+                    else:
+                        st.error("Unable to load video")
             else:
                 st.info("No videos in project yet")
             
@@ -221,19 +486,23 @@ else:
             
             # Current classes
             st.subheader("Current Classes")
-            for i, cls in enumerate(st.session_state.classes):
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    st.text(cls)
-                with col2:
-                    if st.button("❌", key=f"del_{i}"):
-                        if len(st.session_state.classes) > 1:
-                            st.session_state.classes.pop(i)
-                            st.rerun()
+            st.text(", ".join(st.session_state.classes))
+            with st.form("remove_classes", clear_on_submit=True):
+                classes_to_remove = st.multiselect("Classes to remove", st.session_state.classes)
+                remove_submitted = st.form_submit_button("🗑️ Remove Selected")
+            if remove_submitted and classes_to_remove:
+                remaining = [c for c in st.session_state.classes if c not in classes_to_remove]
+                if remaining:
+                    st.session_state.classes = remaining
+                    st.rerun()
+                else:
+                    st.error("At least one class is required")
             
             # Add new class
-            new_class = st.text_input("Add new class")
-            if st.button("➕ Add Class") and new_class:
+            with st.form("add_class", clear_on_submit=True):
+                new_class = st.text_input("Add new class")
+                add_submitted = st.form_submit_button("➕ Add Class")
+            if add_submitted and new_class:
                 if new_class not in st.session_state.classes:
                     st.session_state.classes.append(new_class)
                     st.rerun()
@@ -251,24 +520,18 @@ else:
             if st.button("Export as PASCAL VOC XML"):
                 if st.session_state.annotations and st.session_state.video_path:
                     video_name = Path(st.session_state.video_path).stem
-                    frame = get_frame(st.session_state.video_path, 0)
-                    if frame is not None:
-                        xml_map = generate_pascal_voc_xml(
-                            st.session_state.annotations,
+                    frame_shape = st.session_state.frame_shape
+                    if frame_shape:
+                        zip_data = build_voc_zip(
+                            annotations_digest(st.session_state.annotations),
                             video_name,
-                            frame.shape
+                            frame_shape,
+                            st.session_state.annotations
                         )
-                        if xml_map:
-                            zip_buffer = io.BytesIO()
-                            with zipfile.ZipFile(zip_buffer, 'w') as zipf:
-                                for frame_num, xml_str in xml_map.items():
-                                    xml_filename = f"{video_name}_frame_{frame_num}.xml"
-                                    zipf.writestr(xml_filename, xml_str)
-                            zip_buffer.seek(0)
-
+                        if zip_data:
                             st.download_button(
                                 label="📥 Download XML ZIP",
-                                data=zip_buffer.getvalue(),
+                                data=zip_data,
                                 file_name=f"{video_name}_annotations.zip",
                                 mime="application/zip"
                             )
@@ -284,6 +547,9 @@ else:
                 def metrics_cb(epoch, metrics):
                     st.session_state.training_metrics.append({"epoch": epoch, **metrics})
                 with st.spinner("Training model..."):
+                    # Imported on demand: the torch stack takes seconds to load
+                    # and annotation-only sessions never need it
+                    from training import train_model
                     model_path = train_model(
                         dataset_dir,
                         ann_format,
@@ -305,6 +571,7 @@ else:
                 token = st.text_input("Token", type="password")
                 if st.button("Upload to Hugging Face"):
                     try:
+                        from training import upload_to_huggingface
                         upload_to_huggingface(st.session_state.trained_model_path, repo_id, token)
                         st.success("Upload successful")
                     except Exception as e:
@@ -335,141 +602,16 @@ else:
         with col2:
             st.metric("Frame", f"{frame_num + 1} / {st.session_state.total_frames}")
         
-        # Get current frame
-        current_frame = get_frame(st.session_state.video_path, frame_num)
+        # Get current frame (the mtime makes a re-uploaded video show afresh)
+        video_mtime = Path(st.session_state.video_path).stat().st_mtime
+        background, scale = canvas_background(st.session_state.video_path, frame_num,
+                                              video_mtime)
+        # Decode the neighbours while the user works on this frame
+        prefetch_frames(st.session_state.video_path, frame_num,
+                        st.session_state.total_frames)
         
-        if current_frame is not None:
-            # --- Interactive bounding box annotation ---
-            st.subheader("Draw Bounding Boxes (Interactive)")
-            pil_img = Image.fromarray(current_frame)
-            # Ensure canvas dimensions are integers
-            canvas_height = int(pil_img.height)
-            canvas_width = int(pil_img.width)
-            
-            # Get the saved annotations for this frame to setup initial_drawing
-            # This represents the state before the current interaction.
-            saved_annotations_for_this_frame = st.session_state.annotations.get(frame_num, [])
-
-            # Prepare initial_rects for st_canvas from the saved annotations
-            initial_rects = []
-            for ann in saved_annotations_for_this_frame:
-                x1, y1, x2, y2 = ann['bbox']
-                initial_rects.append({
-                    "type": "rect",
-                    "left": x1, "top": y1,
-                    "width": x2 - x1, "height": y2 - y1,
-                    "stroke": "#000000", 
-                    "fill": "rgba(255, 165, 0, 0.3)",
-                })
-            
-            # Generate a dynamic key for the canvas. This key changes if the number of 
-            # annotations for the frame changes, forcing a re-creation of the canvas component.
-            # This helps prevent state issues within the canvas component during rapid updates.
-            canvas_key = f"canvas_{frame_num}_{len(saved_annotations_for_this_frame)}"
-
-            # This list is a working copy for the current interaction cycle.
-            # It starts with the saved annotations and will be updated based on canvas output and selectboxes.
-            current_annotations_for_frame_being_edited = list(saved_annotations_for_this_frame)
-            
-            canvas_result = st_canvas(
-                fill_color="rgba(255, 165, 0, 0.3)",
-                stroke_width=2,
-                stroke_color="#000000",
-                background_image=pil_img,
-                drawing_mode="rect", # Only allows drawing new rectangles
-                update_streamlit=True, # Reruns on drawing
-                height=canvas_height,
-                width=canvas_width,
-                key=canvas_key, # Use the dynamic key
-                initial_drawing={"version": "4.4.0", "objects": initial_rects} if initial_rects else None
-            )
-            
-            # This list will hold the annotations derived from the current canvas state + selectbox choices
-            processed_annotations_from_this_interaction = [] 
-            
-            if canvas_result.json_data is not None and "objects" in canvas_result.json_data:
-                canvas_drawn_objects = canvas_result.json_data["objects"]
-                num_canvas_objects = len(canvas_drawn_objects)
-
-                # Adjust our working list of annotations to match the number of objects on canvas
-                # Add new placeholder annotations if new boxes were drawn
-                while len(current_annotations_for_frame_being_edited) < num_canvas_objects:
-                    current_annotations_for_frame_being_edited.append({
-                        'class': st.session_state.current_class, # Default for a brand new box
-                        'bbox': [0,0,0,0] # Placeholder, will be updated from canvas obj
-                    })
-
-                # Remove annotations if somehow canvas has fewer objects (e.g., undo if supported, or error)
-                # This is less likely in "rect" mode without explicit delete actions.
-                if num_canvas_objects < len(current_annotations_for_frame_being_edited):
-                    current_annotations_for_frame_being_edited = current_annotations_for_frame_being_edited[:num_canvas_objects]
-
-                for i, obj_from_canvas in enumerate(canvas_drawn_objects):
-                    if obj_from_canvas["type"] == "rect":
-                        x1 = int(obj_from_canvas["left"])
-                        y1 = int(obj_from_canvas["top"])
-                        x2 = int(obj_from_canvas["left"] + obj_from_canvas["width"])
-                        y2 = int(obj_from_canvas["top"] + obj_from_canvas["height"])
-                        current_bbox_from_canvas = [x1, y1, x2, y2]
-
-                        # Get the class for this box. Default to its existing saved class.
-                        # current_annotations_for_frame_being_edited is now synced in length with canvas_drawn_objects
-                        class_for_selectbox_default = current_annotations_for_frame_being_edited[i]['class']
-                        
-                        # Update bbox in our working list
-                        current_annotations_for_frame_being_edited[i]['bbox'] = current_bbox_from_canvas
-                        
-                        # Selectbox for class
-                        label_key = f"label_{frame_num}_{i}"
-                        chosen_class_for_this_box = st.selectbox(
-                            f"Class for Box {i+1}",
-                            st.session_state.classes,
-                            index=st.session_state.classes.index(class_for_selectbox_default) \
-                                if class_for_selectbox_default in st.session_state.classes else 0,
-                            key=label_key
-                        )
-                        
-                        # Update class in our working list
-                        current_annotations_for_frame_being_edited[i]['class'] = chosen_class_for_this_box
-                
-                processed_annotations_from_this_interaction = current_annotations_for_frame_being_edited
-            
-            # Compare the fully processed annotations with what's currently in session_state for this frame.
-            # This determines if a save operation is truly needed.
-            if st.session_state.annotations.get(frame_num, []) != processed_annotations_from_this_interaction:
-                st.session_state.annotations[frame_num] = processed_annotations_from_this_interaction
-                save_annotations(
-                    st.session_state.current_project_id,
-                    video_name,
-                    frame_num,
-                    processed_annotations_from_this_interaction
-                )
-                # A rerun will happen naturally due to state change or widget interaction.
-                # No explicit st.rerun() here unless absolutely necessary.
-
-            # Clear all boxes button
-            if st.button("Clear All Boxes", key=f"clear_{frame_num}"):
-                st.session_state.annotations[frame_num] = []
-                save_annotations(
-                    st.session_state.current_project_id,
-                    video_name,
-                    frame_num,
-                    []
-                )
-                st.rerun()
-            
-            # Statistics
-            st.divider()
-            total_annotations = sum(len(anns) for anns in st.session_state.annotations.values())
-            annotated_frames = len(st.session_state.annotations)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Total Annotations", total_annotations)
-            with col2:
-                st.metric("Annotated Frames", annotated_frames)
-            with col3:
-                st.metric("Remaining Frames", st.session_state.total_frames - annotated_frames)
+        if background is not None:
+            annotation_canvas(background, scale, frame_num, video_name)
     
     elif st.session_state.current_project_id:
         st.info("👈 Please select a video from the sidebar to begin annotation")
\ No newline at end of file